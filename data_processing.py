@@ -1,6 +1,7 @@
 import pandas as pd
 import os
-from datetime import datetime
+
+from records import UserRecord, ActivityRecord, TrackpointBatch
 
 def read_file_to_list(file_path: str) -> list:
     """
@@ -18,102 +19,110 @@ def read_file_to_list(file_path: str) -> list:
         return None
 
 
-def process_users(path: str, labeled_ids: list) -> list:
+def process_users(path: str, labeled_ids: list) -> list[UserRecord]:
     """
-    Processes user directories and returns a list of user data.
+    Processes user directories and returns a list of user records.
 
     :param path: The path to the user directories.
     :param labeled_ids: A list of labeled user IDs.
-    :return: A list of dictionaries, each containing user data.
+    :return: A list of user records.
     """
     user_rows = []
     with os.scandir(path) as users:
         for user in users:
             if user.is_dir():
-                user_row = {
-                    "_id": user.name,
-                    "has_labels": user.name in labeled_ids,
-                    "meta": {"path": user.path}
-                }
-                user_rows.append(user_row)
+                user_rows.append(UserRecord(user.name, user.name in labeled_ids, user.path))
     return user_rows
 
 
-def preprocess_activities(user_row: dict) -> list:
+def preprocess_activities(user_row: UserRecord) -> list[ActivityRecord]:
     """
-    Processes activity files and returns a list of activity data.
+    Processes activity files and returns a list of activity records.
 
-    :param user_row: A dictionary containing user data.
-    :return: A list of dictionaries, each containing activity data.
+    :param user_row: The user record.
+    :return: A list of activity records, only holding ids and file paths.
     """
     activity_rows = []
-    with os.scandir(user_row['meta']['path'] + "/Trajectory") as activities:
+    with os.scandir(user_row.path + "/Trajectory") as activities:
         for activity in activities:
             if activity.is_file():
-                activity_row = {
-                    "_id": int(activity.name[:-4] + user_row["_id"]),
-                    "user_id": user_row["_id"],
-                    "transportation_mode": None,
-                    "meta": {"path": activity.path}
-                }
-                activity_rows.append(activity_row)
+                activity_rows.append(ActivityRecord(int(activity.name[:-4] + user_row._id), user_row._id,
+                                                    activity.path))
     return activity_rows
 
 
-def process_activity(user_row: dict, activity_row: dict) -> tuple:
+def read_labels(user_row: UserRecord) -> pd.DataFrame:
     """
-    Processes an activity and returns the expanded activity data and trackpoints data frame.
+    Reads the transportation labels of a user, once per user.
 
-    :param user_row: A dictionary containing user data.
-    :param activity_row: A dictionary containing activity data.
-    :return: A tuple containing the expanded activity data and trackpoints data frame.
+    :param user_row: The user record.
+    :return: A data frame of the user's labels.
+    """
+    if user_row.labels is None:
+        transportations = pd.read_table(user_row.path + "/labels.txt")
+        transportations['Start Time'] = pd.to_datetime(transportations['Start Time'])
+        transportations['End Time'] = pd.to_datetime(transportations['End Time'])
+        user_row.labels = transportations
+    return user_row.labels
+
+
+def process_activity(user_row: UserRecord, activity_row: ActivityRecord) -> tuple:
+    """
+    Processes an activity and returns the expanded activity record and its trackpoints.
+
+    :param user_row: The user record.
+    :param activity_row: The activity record.
+    :return: A tuple containing the expanded activity record and a batch of its trackpoints.
     """
     columns = ['lat', 'lon', 'dep1', 'alt', 'date', 'date_str', 'time_str']
-    trackpoints_df = pd.read_table(activity_row['meta']['path'], skiprows=6, names=columns, delimiter=',')
+    trackpoints_df = pd.read_table(activity_row.path, skiprows=6, names=columns, delimiter=',')
 
     if trackpoints_df.shape[0] > 2500:
         return None, None
 
-    activity_row['start_date_time'] = pd.to_datetime(
+    activity_row.start_date_time = pd.to_datetime(
         trackpoints_df['date_str'].iloc[0] + " " + trackpoints_df['time_str'].iloc[0])
-    activity_row['end_date_time'] = pd.to_datetime(
+    activity_row.end_date_time = pd.to_datetime(
         trackpoints_df['date_str'].iloc[-1] + " " + trackpoints_df['time_str'].iloc[-1])
 
-    if user_row['has_labels']:
-        transportations = pd.read_table(user_row['meta']['path'] + "/labels.txt")
-        transportations['Start Time'] = pd.to_datetime(transportations['Start Time'])
-        transportations['End Time'] = pd.to_datetime(transportations['End Time'])
+    if user_row.has_labels:
+        transportations = read_labels(user_row)
 
         time_tolerance = pd.Timedelta(seconds=0)
         matching_transport = transportations[
-            (transportations['Start Time'].between(activity_row['start_date_time'] - time_tolerance,
-                                                   activity_row['start_date_time'] + time_tolerance)) &
-            (transportations['End Time'].between(activity_row['end_date_time'] - time_tolerance,
-                                                 activity_row['end_date_time'] + time_tolerance))
+            (transportations['Start Time'].between(activity_row.start_date_time - time_tolerance,
+                                                   activity_row.start_date_time + time_tolerance)) &
+            (transportations['End Time'].between(activity_row.end_date_time - time_tolerance,
+                                                 activity_row.end_date_time + time_tolerance))
             ]
 
         if not matching_transport.empty:
-            activity_row['transportation_mode'] = matching_transport['Transportation Mode'].iloc[0]
+            activity_row.transportation_mode = matching_transport['Transportation Mode'].iloc[0]
 
-    return activity_row, trackpoints_df
+    return activity_row, TrackpointBatch(activity_row._id, user_row._id, trackpoints_df)
 
 
-def process_trackpoint(activity_id: int, trackpoint_row: pd.Series, user_id: str) -> dict:
+def scan_data_files(path: str) -> dict:
     """
-    Processes a trackpoint and returns the trackpoint data.
+    Finds the trajectory and label files of every user directory, with their modification time and size.
 
-    :param activity_id: The ID of the activity.
-    :param trackpoint_row: A pandas Series containing trackpoint data.
-    :return: A dictionary containing the processed trackpoint data.
+    :param path: The path to the user directories.
+    :return: A dictionary of file path -> (user ID, modification time in ns, size in bytes).
     """
-    return {
-        'activity_id': activity_id,
-        'lat': trackpoint_row['lat'],
-        'lon': trackpoint_row['lon'],
-        'altitude': trackpoint_row['alt'] if trackpoint_row['alt'] != -777 else None,
-        'date_days': trackpoint_row['date'],
-        'date_time': datetime.strptime(trackpoint_row['date_str'] + " " + trackpoint_row['time_str'],
-                                       '%Y-%m-%d %H:%M:%S'),
-        #'date_time': trackpoint_row['date_str'] + " " + trackpoint_row['time_str'], #TODO CAST TIL DATE!! 😘
-        'user_id': user_id
-    }
+    files = dict()
+    with os.scandir(path) as users:
+        for user in users:
+            if not user.is_dir():
+                continue
+            with os.scandir(user.path) as entries:
+                for entry in entries:
+                    if entry.name == "labels.txt" and entry.is_file():
+                        stat = entry.stat()
+                        files[entry.path] = (user.name, stat.st_mtime_ns, stat.st_size)
+                    elif entry.name == "Trajectory" and entry.is_dir():
+                        with os.scandir(entry.path) as activities:
+                            for activity in activities:
+                                if activity.name.endswith(".plt") and activity.is_file():
+                                    stat = activity.stat()
+                                    files[activity.path] = (user.name, stat.st_mtime_ns, stat.st_size)
+    return files
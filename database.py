@@ -4,6 +4,13 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Trackpoint index for time-ordered retrieval of a user's points. The fields after (user_id, date_time)
+# let the index cover the retrieval projection
+# Trackpoint index for reading activities in recorded order, used by the partitioned scan, the sampled
+# approximations and when replacing changed activities
+ACTIVITY_INDEX = [('activity_id', 1), ('_id', 1)]
+TRAJECTORY_INDEX = [('user_id', 1), ('date_time', 1), ('activity_id', 1), ('lat', 1), ('lon', 1)]
+
 
 class DbConnector:
     """
@@ -40,10 +47,14 @@ class DbConnector:
         print("\n-----------------------------------------------")
         print("Connection to %s-db is closed" % self.db.name)
 
-    def insert(batch: list[dict], collection):
-        if 'meta' in batch[0].keys():
-                for row in batch:
-                    del row['meta']
-        
-        collection.insert_many(batch)
-        
\ No newline at end of file
+    def create_indexes(self):
+        """
+        Builds the trackpoint indexes the queries rely on. Does nothing for indexes that already exist.
+        """
+        self.db['trackpoint'].create_index(ACTIVITY_INDEX)
+        self.db['trackpoint'].create_index(TRAJECTORY_INDEX)
+
+    @staticmethod
+    def insert(batch: list, collection):
+        # Records only expose their persisted fields through to_document
+        collection.insert_many(row.to_document() for row in batch)
@@ -1,10 +1,13 @@
 from part1 import Part1
 from part2 import Part2
 
-# Upload data to database
-#part1 = Part1()
-#part1.upload_data()
-
-part2 = Part2()
-part2.execute_tasks(task_nums=[9,10,11])
+# Guard needed since the partitioned scan starts worker processes that re-import this module
+if __name__ == '__main__':
+    # Upload data to database
+    #part1 = Part1()
+    #part1.upload_data()
+    #part1.watch_data()  # Keep inserting new trajectory files as they arrive
 
+    part2 = Part2()
+    part2.execute_tasks(task_nums=[9,10,11])
+    #part2.benchmark_partitioned_scan(computation='altitude', worker_counts=[1, 2, 4, 8])
@@ -1,11 +1,15 @@
+import os
 import time
-import copy
-import pandas as pd
+from itertools import chain, islice
 from database import DbConnector
-from data_processing import (process_users, preprocess_activities, process_activity, process_trackpoint,
-                             read_file_to_list)
+from data_processing import (process_users, preprocess_activities, process_activity, read_file_to_list,
+                             scan_data_files)
+from records import ActivityRecord, UserRecord
 from helpers import time_elapsed_str
 
+# Documents per insert_many call. pymongo materializes every document it is given, so large inserts are chunked
+INSERT_CHUNK_SIZE = 10_000
+
 
 class Part1:
     def __init__(self):
@@ -20,19 +24,23 @@ class Part1:
         self.activity_collection = self.database['activity']
         self.tp_collection = self.database['trackpoint']
 
-    def delete_meta(self, batch: list[dict]):
-        if 'meta' in batch[0].keys():
-                for row in batch:
-                    del row['meta']
-        return batch
-        
+    def insert_chunked(self, collection, documents):
+        """
+        Insert documents from an iterable in bounded insert_many calls.
+
+        :param collection: The collection to insert into.
+        :param documents: An iterable of documents, consumed lazily.
+        """
+        documents = iter(documents)
+        while chunk := list(islice(documents, INSERT_CHUNK_SIZE)):
+            collection.insert_many(chunk)
 
     def push_buffers_to_db(self, activity_buffer, trackpoint_buffer, num_activities, num_trackpoints):
         """
         Push processed activities and trackpoints to the database.
 
-        :param activity_buffer: A list of buffered activities.
-        :param trackpoint_buffer: A list of buffered trackpoints.
+        :param activity_buffer: A list of buffered activity records.
+        :param trackpoint_buffer: A list of buffered trackpoint batches, one per activity.
         :param num_activities: The number of activities.
         :param num_trackpoints: The number of trackpoints.
         """
@@ -40,11 +48,12 @@ class Part1:
         print(f'\nInserting: {num_activities} activities and {num_trackpoints} trackpoints')
 
         # Insert activities
-        self.activity_collection.insert_many(self.delete_meta(activity_buffer))
+        self.insert_chunked(self.activity_collection, (activity.to_document() for activity in activity_buffer))
         activity_buffer.clear()
 
-        # Insert trackpoints
-        self.tp_collection.insert_many(trackpoint_buffer)
+        # Insert trackpoints, only one chunk of documents exists next to the column-wise batches at a time
+        self.insert_chunked(self.tp_collection,
+                            chain.from_iterable(batch.to_documents() for batch in trackpoint_buffer))
         trackpoint_buffer.clear()
 
         print(f'\tInsertion time: {time_elapsed_str(insert_time)}\n'
@@ -61,38 +70,40 @@ class Part1:
         self.drop_collections() # Remove collections in db before insertion
         start_time = time.time()
         users_rows = process_users(path=data_path, labeled_ids=labeled_ids)
-        users_row_copy = copy.deepcopy(users_rows)
-        users_row_copy = self.delete_meta(users_row_copy)
-        self.user_collection.insert_many(users_row_copy)
+        self.user_collection.insert_many(user_row.to_document() for user_row in users_rows)
         num_users = len(users_rows)
         print(f"Inserted {num_users} users into User\n")
 
         activity_buffer = []
         trackpoint_buffer = []
+        num_trackpoints = 0
 
         for i, user_row in enumerate(users_rows):
             activity_rows = preprocess_activities(user_row=user_row)
 
             for activity_row in activity_rows:
-                activity, trackpoints_df = process_activity(user_row, activity_row=activity_row)
+                activity, trackpoints = process_activity(user_row, activity_row=activity_row)
                 if not activity:  # means number of trackpoints > 2500
                     continue
 
                 activity_buffer.append(activity)
+                trackpoint_buffer.append(trackpoints)
+                num_trackpoints += len(trackpoints)
 
-                for _, trackpoint_row in trackpoints_df.iterrows():
-                    trackpoint = process_trackpoint(activity["_id"], trackpoint_row, user_row["_id"])
-                    trackpoint_buffer.append(trackpoint)
-
-                num_activities, num_trackpoints = len(activity_buffer), len(trackpoint_buffer)
+                num_activities = len(activity_buffer)
                 if num_activities + num_trackpoints > insert_threshold:
                     self.push_buffers_to_db(activity_buffer, trackpoint_buffer, num_activities, num_trackpoints)
+                    num_trackpoints = 0
 
             print(
-                f'\rUser {user_row["_id"]} processed ({i + 1} / {num_users}), Time elapsed: {time_elapsed_str(start_time)}',
+                f'\rUser {user_row._id} processed ({i + 1} / {num_users}), Time elapsed: {time_elapsed_str(start_time)}',
                 end='')
 
-        self.push_buffers_to_db(activity_buffer, trackpoint_buffer, len(activity_buffer), len(trackpoint_buffer))
+        self.push_buffers_to_db(activity_buffer, trackpoint_buffer, len(activity_buffer), num_trackpoints)
+
+        index_time = time.time()
+        self.connector.create_indexes()
+        print(f'Indexes built in {time_elapsed_str(index_time)}')
         print(f'\nInsertion complete - Total time: {time_elapsed_str(start_time)}')
 
     def upload_data(self):
@@ -105,6 +116,150 @@ class Part1:
         self.insert_data(data_path, labeled_ids, insert_threshold=325 * 10e2)
         self.connector.close_connection()
 
+    def ingest_files(self, paths: list[str], files: dict, users: dict, labeled_ids: list, insert_threshold=10e4):
+        """
+        Insert new or changed trajectory and label files into the database.
+
+        :param paths: The file paths to ingest.
+        :param files: The current scan of the data directory, file path -> (user ID, mtime, size).
+        :param users: The known user records by ID, new users are added to it.
+        :param labeled_ids: A list of labeled IDs.
+        :param insert_threshold: The threshold for batch insertion.
+        :return: A list of the file paths that failed to be processed.
+        """
+        activity_buffer = []
+        trackpoint_buffer = []
+        num_trackpoints = 0
+        replaced_ids = []
+        failed_paths = []
+
+        def flush():
+            # Earlier versions of the activities are removed right before their replacements are inserted
+            if replaced_ids:
+                self.activity_collection.delete_many({'_id': {'$in': replaced_ids}})
+                self.tp_collection.delete_many({'activity_id': {'$in': replaced_ids}})
+                replaced_ids.clear()
+            if activity_buffer:
+                self.push_buffers_to_db(activity_buffer, trackpoint_buffer, len(activity_buffer), num_trackpoints)
+
+        # Labels first, so trajectories in the same batch are matched against them
+        paths = sorted(paths, key=lambda path: not path.endswith("labels.txt"))
+        for path in paths:
+            user_id = files[path][0]
+            user_row = users.get(user_id)
+            if not user_row:
+                user_path = os.path.dirname(path) if path.endswith("labels.txt") else os.path.dirname(
+                    os.path.dirname(path))
+                has_labels = user_id in labeled_ids or os.path.join(user_path, "labels.txt") in files
+                user_row = users[user_id] = UserRecord(user_id, has_labels, user_path)
+                self.user_collection.replace_one({'_id': user_id}, user_row.to_document(), upsert=True)
+                print(f'New user {user_id}')
+
+            if path.endswith("labels.txt"):
+                user_row.labels = None  # Re-read on next use
+                if not user_row.has_labels:
+                    user_row.has_labels = True
+                    self.user_collection.replace_one({'_id': user_id}, user_row.to_document(), upsert=True)
+                continue
+
+            activity_row = ActivityRecord(int(os.path.basename(path)[:-4] + user_id), user_id, path)
+            try:
+                activity, trackpoints = process_activity(user_row, activity_row=activity_row)
+            except Exception as e:
+                print(f"Failed to process {path}: {e}")
+                failed_paths.append(path)
+                continue
+
+            # Changed files replace their earlier version, a file grown past 2500 trackpoints only removes it
+            replaced_ids.append(activity_row._id)
+            if not activity:  # means number of trackpoints > 2500
+                continue
+
+            activity_buffer.append(activity)
+            trackpoint_buffer.append(trackpoints)
+            num_trackpoints += len(trackpoints)
+
+            if len(activity_buffer) + num_trackpoints > insert_threshold:
+                flush()
+                num_trackpoints = 0
+
+        flush()
+        return failed_paths
+
+    def watch_data(self, data_path='./dataset/dataset/Data', labeled_ids_path='./dataset/dataset/labeled_ids.txt',
+                   poll_interval=2, debounce=5, ingest_existing=False, insert_threshold=325 * 10e2):
+        """
+        Watch the data directory and continuously insert newly arriving or changed trajectory files.
+        The directory is polled with os.scandir, and a file is ingested once its modification time and size
+        have been unchanged for the debounce interval. Runs until interrupted.
+
+        :param data_path: The path to the user directories.
+        :param labeled_ids_path: The path to the file with labeled user IDs.
+        :param poll_interval: Seconds between scans of the data directory.
+        :param debounce: Seconds a file must stay unchanged before it is ingested.
+        :param ingest_existing: Also ingest the files present at startup, otherwise they are assumed uploaded.
+        :param insert_threshold: The threshold for batch insertion.
+        """
+        # Lets changed activities be replaced without scanning the trackpoint collection
+        self.connector.create_indexes()
+
+        # File path -> (mtime, size) of ingested files, of files that failed to be processed,
+        # and of changed files waiting for the debounce interval
+        ingested = dict()
+        failed = dict()
+        pending = dict()
+        # Known users by ID, users without a document yet are created on their first file
+        users = dict()
+        if not ingest_existing:
+            ingested = {path: stat[1:] for path, stat in scan_data_files(data_path).items()}
+            for user_row in self.user_collection.find():
+                users[user_row['_id']] = UserRecord(user_row['_id'], user_row['has_labels'],
+                                                    os.path.join(data_path, user_row['_id']))
+
+        print(f'Watching {data_path} for new trajectories (Ctrl+C to stop)')
+        try:
+            while True:
+                files = scan_data_files(data_path)
+                now = time.time()
+
+                for path, (_, mtime, size) in files.items():
+                    # Failed files are only retried once they change
+                    if ingested.get(path) == (mtime, size) or failed.get(path) == (mtime, size):
+                        continue
+                    if path not in pending or pending[path][0] != (mtime, size):
+                        pending[path] = ((mtime, size), now)
+
+                # Files that disappeared before they settled are dropped
+                for path in [path for path in pending if path not in files]:
+                    del pending[path]
+
+                ready = [path for path, (_, changed_at) in pending.items() if now - changed_at >= debounce]
+                if ready:
+                    # New or changed labels re-ingest the user's trajectories that were ingested without them,
+                    # or that failed because the labels were missing
+                    labeled_users = {files[path][0] for path in ready if path.endswith("labels.txt")}
+                    ready += [path for path in chain(ingested, failed) if path not in pending
+                              and path.endswith(".plt") and path in files and files[path][0] in labeled_users]
+
+                    labeled_ids = read_file_to_list(labeled_ids_path) or []
+                    failed_paths = set(self.ingest_files(ready, files, users, labeled_ids,
+                                                         insert_threshold=insert_threshold))
+                    for path in ready:
+                        pending.pop(path, None)
+                        # A path is either ingested or failed, an earlier ingested version stays in the database
+                        if path in failed_paths:
+                            ingested.pop(path, None)
+                            failed[path] = files[path][1:]
+                        else:
+                            failed.pop(path, None)
+                            ingested[path] = files[path][1:]
+
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            print('\nStopped watching')
+        finally:
+            self.connector.close_connection()
+
     def drop_collections(self):
         self.user_collection.drop()
         self.user_collection.drop()
@@ -1,12 +1,17 @@
 # QUERIES
+import math
 import time
 import copy
+import numpy as np
 import pandas as pd
 from tabulate import tabulate
 from datetime import datetime
 from haversine import haversine
+from itertools import groupby
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from database import DbConnector
+from database import DbConnector, ACTIVITY_INDEX
 def print_question(task_num: int, question_text: str, letter:str = ""):
     """
     Prints task introduction.
@@ -39,6 +44,157 @@ def print_result(result_df: pd.DataFrame or dict[str, list], floatfmt=".0f", fil
         with open(f'task_outputs/{filename}.txt', 'w') as f:
             f.write(display)
 
+
+def altitude_gained(trackpoints: list[dict]):
+    """
+    Sums the altitude deltas between consecutive trackpoints of one activity, skipping invalid altitudes.
+    Args:
+        trackpoints: the trackpoints of a single activity, in recorded order
+
+    Returns:
+        The altitude gained, or None if the activity has fewer than two trackpoints
+    """
+    if len(trackpoints) < 2:
+        return None
+
+    gained = 0
+    for tp_1, tp_2 in zip(trackpoints, trackpoints[1:]):
+        # Only include valid altitudes
+        if not tp_1['altitude'] or not tp_2['altitude']:
+            continue
+        gained += tp_2['altitude'] - tp_1['altitude']
+    return gained
+
+
+def is_invalid_activity(trackpoints: list[dict]):
+    """
+    Checks if consecutive trackpoints of one activity deviate with at least 5 minutes.
+    Args:
+        trackpoints: the trackpoints of a single activity, in recorded order
+
+    Returns:
+        1 if the activity is invalid, 0 if not, or None if the activity has fewer than two trackpoints
+    """
+    if len(trackpoints) < 2:
+        return None
+
+    for tp_1, tp_2 in zip(trackpoints, trackpoints[1:]):
+        if (tp_2['date_time'] - tp_1['date_time']).seconds > 60 * 5:
+            return 1
+    return 0
+
+
+# Bounding box of the Forbidden City in Beijing used by task 10
+FORBIDDEN_CITY_LAT = (39.916, 39.917)
+FORBIDDEN_CITY_LON = (116.397, 116.398)
+
+
+def visited_forbidden_city(trackpoints: list[dict]):
+    """
+    Checks if any trackpoint of one activity lies within the Forbidden City.
+    Args:
+        trackpoints: the trackpoints of a single activity
+
+    Returns:
+        1 if the activity visited the Forbidden City, 0 if not, or None if the activity has no trackpoints
+    """
+    if not trackpoints:
+        return None
+
+    for tp in trackpoints:
+        if (FORBIDDEN_CITY_LAT[0] <= tp['lat'] <= FORBIDDEN_CITY_LAT[1] and
+                FORBIDDEN_CITY_LON[0] <= tp['lon'] <= FORBIDDEN_CITY_LON[1]):
+            return 1
+    return 0
+
+
+# Meters per degree of latitude, used to size the co-location grid. Slightly below the
+# ~111 195 m of the haversine earth radius, so cells are never smaller than the search distance
+METERS_PER_DEGREE = 111_000
+EPOCH = datetime(1970, 1, 1)
+
+
+def colocation_lon_width(row: int, lat_width: float) -> float:
+    """
+    Width in degrees of longitude of the co-location grid cells in a latitude row.
+    The width is widened for the most poleward latitude of the neighbouring rows, so any point within
+    the cell distance of a point in this row or the rows next to it is at most one cell away.
+    Args:
+        row: latitude row index of the grid
+        lat_width: height of a grid cell in degrees of latitude
+
+    Returns:
+        Width of the cells in the row in degrees of longitude
+    """
+    poleward_lat = min(max(abs((row - 1) * lat_width), abs((row + 2) * lat_width)), 89.0)
+    return lat_width / math.cos(math.radians(poleward_lat))
+
+
+# Fields returned by trajectory retrieval, all covered by database.TRAJECTORY_INDEX
+TRAJECTORY_FIELDS = ['date_time', 'activity_id', 'lat', 'lon']
+
+
+# Per-activity computations available to the partitioned scan: name -> (trackpoint fields, function)
+SCAN_COMPUTATIONS = {
+    'altitude': (['altitude'], altitude_gained),
+    'invalid': (['date_time'], is_invalid_activity),
+    'forbidden_city': (['lat', 'lon'], visited_forbidden_city),
+}
+
+# Trackpoint collection of a scan worker process, opened once per process by _init_scan_worker
+_scan_collection = None
+
+
+def accumulate_per_user(cursor, per_activity, user_sums: dict, user_squares: dict = None):
+    """
+    Runs a per-activity computation over trackpoints sorted by activity and adds the results up per user.
+    Args:
+        cursor: trackpoints sorted by activity_id, with user_id and the fields the computation needs
+        per_activity: function computing one value from the trackpoints of an activity
+        user_sums: dictionary of user_id -> sum of values, updated in place
+        user_squares: dictionary of user_id -> sum of squared values, updated in place if given
+    """
+    # Trackpoints arrive grouped by activity, so each activity is handled once and never kept in memory
+    for _, activity_trackpoints in groupby(cursor, key=itemgetter('activity_id')):
+        trackpoints = list(activity_trackpoints)
+        value = per_activity(trackpoints)
+        if value is None:
+            continue
+        user_id = trackpoints[0]['user_id']
+        user_sums[user_id] = user_sums.get(user_id, 0) + value
+        if user_squares is not None:
+            user_squares[user_id] = user_squares.get(user_id, 0) + value * value
+
+
+def _init_scan_worker():
+    """
+    Opens a dedicated database connection for a scan worker process.
+    """
+    global _scan_collection
+    _scan_collection = DbConnector().db['trackpoint']
+
+
+def _scan_partition(computation: str, lower: int, upper: int, inclusive_upper: bool) -> dict:
+    """
+    Scans the trackpoints of one activity_id range and aggregates a per-activity computation per user.
+    Args:
+        computation: key in SCAN_COMPUTATIONS
+        lower: lowest activity_id in the range (inclusive)
+        upper: upper activity_id bound of the range
+        inclusive_upper: whether upper itself belongs to the range (only for the last range)
+
+    Returns:
+        Dictionary of user_id -> summed result of the computation for the user's activities in the range
+    """
+    fields, per_activity = SCAN_COMPUTATIONS[computation]
+    query = {'activity_id': {'$gte': lower, '$lte' if inclusive_upper else '$lt': upper}}
+    projection = {'_id': False, 'user_id': True, 'activity_id': True, **{field: True for field in fields}}
+    cursor = _scan_collection.find(query, projection).sort([('activity_id', 1), ('_id', 1)])
+
+    user_totals = dict()
+    accumulate_per_user(cursor, per_activity, user_totals)
+    return user_totals
+
 class Part2:
     def __init__(self):
         """
@@ -83,6 +239,181 @@ class Part2:
         for doc in trackpoint_10_docs:
             print(doc)
 
+    def activity_partitions(self, num_partitions: int) -> list[tuple]:
+        """
+        Splits the activity ids into disjoint ranges of roughly the same number of activities.
+
+        :param num_partitions: The number of ranges to create.
+        :return: A list of (lower, upper, inclusive_upper) tuples covering every activity id.
+        """
+        pipeline = [{'$bucketAuto': {'groupBy': '$_id', 'buckets': num_partitions}}]
+        buckets = list(self.activity_collection.aggregate(pipeline))
+
+        # $bucketAuto bounds are [min, max) except for the last bucket, where max is inclusive
+        return [(bucket['_id']['min'], bucket['_id']['max'], i == len(buckets) - 1)
+                for i, bucket in enumerate(buckets)]
+
+    def partitioned_scan(self, computation: str, workers: int = 4, partitions_per_worker: int = 4) -> dict:
+        """
+        Runs a per-activity computation over all trackpoints, scanning activity_id ranges in parallel.
+        Activities are never split across ranges, so consecutive trackpoint pairs stay within one worker.
+
+        :param computation: The computation to run, a key in SCAN_COMPUTATIONS.
+        :param workers: The number of worker processes, each with its own connection.
+        :param partitions_per_worker: Ranges per worker, smaller ranges balance the load better.
+        :return: A dictionary of user_id -> merged result of the computation.
+        """
+        # Lets every range be read in (activity_id, insertion) order straight from the index
+        self.tp_collection.create_index(ACTIVITY_INDEX)
+        partitions = self.activity_partitions(workers * partitions_per_worker)
+
+        user_totals = dict()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_scan_worker) as executor:
+            futures = [executor.submit(_scan_partition, computation, lower, upper, inclusive_upper)
+                       for lower, upper, inclusive_upper in partitions]
+            for future in as_completed(futures):
+                for user_id, value in future.result().items():
+                    user_totals[user_id] = user_totals.get(user_id, 0) + value
+        return user_totals
+
+    def benchmark_partitioned_scan(self, computation: str = 'altitude', worker_counts: list[int] = (1, 2, 4, 8)):
+        """
+        Times the partitioned scan for different worker counts and reports the speedup over one worker.
+
+        :param computation: The computation to run, a key in SCAN_COMPUTATIONS.
+        :param worker_counts: The worker counts to time, a 1-worker baseline is always included.
+        """
+        print(f'Partitioned scan benchmark ({computation}):')
+        results = []
+        for workers in sorted({1, *worker_counts}):
+            start_time = time.time()
+            self.partitioned_scan(computation, workers=workers)
+            elapsed = time.time() - start_time
+            # The first run is the 1-worker baseline
+            baseline = results[0][1] if results else elapsed
+            results.append([workers, elapsed, baseline / elapsed])
+
+        df = pd.DataFrame(results, columns=["Workers", "Time (s)", "Speedup"])
+        print_result(result_df=df, filename=f"partitioned_scan_{computation}", floatfmt=".2f")
+
+    def approximate_per_user(self, computation: str, sample_fraction: float = 0.05, time_budget: float = None,
+                             chunk_size: int = 200, z: float = 1.96) -> tuple[dict, int]:
+        """
+        Estimates the per-user total of a per-activity computation from a uniform sample of whole activities.
+        Activities are drawn with $sample and only their trackpoints are fetched. Per-user totals are
+        extrapolated from the sample mean, with a confidence interval from the finite-population variance.
+
+        :param computation: The computation to estimate, a key in SCAN_COMPUTATIONS.
+        :param sample_fraction: The fraction of activities to sample, None to sample until the time budget is used.
+        :param time_budget: Stop sampling after this many seconds, the activities processed so far are the sample.
+        :param chunk_size: Number of sampled activities fetched per trackpoint query.
+        :param z: The z-score of the confidence interval, 1.96 for 95 %.
+        :return: A dictionary of user_id -> (estimate, confidence interval half-width), and the sample size.
+        """
+        # The time budget covers drawing the sample too. The index on activity_id is built at insertion,
+        # see DbConnector.create_indexes
+        start_time = time.time()
+        fields, per_activity = SCAN_COMPUTATIONS[computation]
+
+        num_activities = self.activity_collection.count_documents({})
+        if sample_fraction is None:
+            sample_size = num_activities
+        else:
+            sample_size = max(2, round(num_activities * sample_fraction))
+
+        # A random ordering of activities, so every prefix cut off by the time budget is a uniform sample
+        sampled = self.activity_collection.aggregate([{'$sample': {'size': sample_size}},
+                                                      {'$project': {'_id': True}}])
+        sampled_ids = list(dict.fromkeys(activity['_id'] for activity in sampled))
+
+        projection = {'_id': False, 'user_id': True, 'activity_id': True, **{field: True for field in fields}}
+        user_sums = dict()
+        user_squares = dict()
+        num_sampled = 0
+
+        for i in range(0, len(sampled_ids), chunk_size):
+            if time_budget and num_sampled and time.time() - start_time > time_budget:
+                break
+
+            chunk = sampled_ids[i:i + chunk_size]
+            cursor = self.tp_collection.find({'activity_id': {'$in': chunk}}, projection) \
+                .sort([('activity_id', 1), ('_id', 1)])
+            accumulate_per_user(cursor, per_activity, user_sums, user_squares)
+            num_sampled += len(chunk)
+
+        # Each sampled activity contributes its value to its own user and 0 to every other user
+        estimates = dict()
+        for user_id, value_sum in user_sums.items():
+            mean = value_sum / num_sampled
+            variance = (user_squares[user_id] - value_sum * mean) / (num_sampled - 1) if num_sampled > 1 else 0
+            standard_error = num_activities * math.sqrt(
+                max(variance, 0) * (1 - num_sampled / num_activities) / num_sampled)
+            estimates[user_id] = (num_activities * mean, z * standard_error)
+
+        return estimates, num_sampled
+
+    def print_approximate_result(self, computation: str, value_column: str, filename: str,
+                                 sample_fraction: float, time_budget: float, limit: int = None,
+                                 positive_only: bool = False, floatfmt: str = ".1f"):
+        """
+        Estimates a per-user computation from a sample and prints the estimates with their confidence intervals.
+
+        :param computation: The computation to estimate, a key in SCAN_COMPUTATIONS.
+        :param value_column: Column header of the estimates.
+        :param filename: Name of the file to write the result table to.
+        :param sample_fraction: The fraction of activities to sample, see approximate_per_user.
+        :param time_budget: Time budget in seconds for sampling, see approximate_per_user.
+        :param limit: Only show the users with the highest estimates.
+        :param positive_only: Leave out users with an estimate of 0.
+        :param floatfmt: Decimal precision.
+        """
+        estimates, num_sampled = self.approximate_per_user(computation, sample_fraction=sample_fraction,
+                                                           time_budget=time_budget)
+        user_estimates = sorted(estimates.items(), key=lambda x: x[1][0], reverse=True)
+        results = [[user_id, estimate, interval] for user_id, (estimate, interval) in user_estimates[:limit]
+                   if estimate > 0 or not positive_only]
+
+        df = pd.DataFrame(results, columns=["User ID", value_column, "95% CI (±)"])
+        print(f"\nEstimated from {num_sampled} sampled activities")
+        print_result(result_df=df, filename=filename, floatfmt=floatfmt)
+
+    def evaluate_approximation(self, computation: str = 'altitude', sample_fractions: list[float] = (0.01, 0.05, 0.1),
+                               workers: int = 4):
+        """
+        Measures the accuracy of approximate per-user results against the exact results of a full scan.
+
+        :param computation: The computation to evaluate, a key in SCAN_COMPUTATIONS.
+        :param sample_fractions: The sample fractions to evaluate.
+        :param workers: Worker processes for the exact partitioned scan.
+        """
+        print(f'Approximation accuracy ({computation}):')
+        start_time = time.time()
+        exact = self.partitioned_scan(computation, workers=workers)
+        results = [["Exact", self.activity_collection.count_documents({}), time.time() - start_time, 0, 100, 100]]
+        exact_total = sum(exact.values())
+
+        for sample_fraction in sample_fractions:
+            start_time = time.time()
+            estimates, num_sampled = self.approximate_per_user(computation, sample_fraction=sample_fraction)
+            elapsed = time.time() - start_time
+
+            estimate_total = sum(estimate for estimate, _ in estimates.values())
+            total_error = abs(estimate_total - exact_total) / abs(exact_total) * 100 if exact_total else 0
+
+            # Users absent from the sample are estimated as 0 with an empty interval
+            covered = sum(abs(estimates.get(user_id, (0, 0))[0] - value) <= estimates.get(user_id, (0, 0))[1]
+                          for user_id, value in exact.items())
+            users = [user_id for user_id, value in exact.items() if value]
+            found = sum(user_id in estimates for user_id in users)
+
+            results.append([f"{sample_fraction:.0%}", num_sampled, elapsed, total_error,
+                            covered / len(exact) * 100 if exact else 100,
+                            found / len(users) * 100 if users else 100])
+
+        df = pd.DataFrame(results, columns=["Sample", "Activities", "Time (s)", "Total error (%)",
+                                            "CI coverage (%)", "Users found (%)"])
+        print_result(result_df=df, filename=f"approximation_{computation}", floatfmt=".2f")
+
     """
     Query 1: How many users, activities and trackpoints are there in the dataset (after it is inserted into the database).
     """
@@ -295,6 +626,99 @@ class Part2:
         print("")
         print_result(result_df=result, filename="task_7", floatfmt=".2f")
 
+    def trajectory(self, user_id: str, start: datetime, end: datetime, modes: list[str] = None,
+                   activity_ids: list[int] = None, as_numpy: bool = False):
+        """
+        Retrieves the trackpoints of a user within a time range, in time order.
+        The query is answered from the (user_id, date_time) compound index alone, without fetching documents.
+        The index is built when data is inserted, see DbConnector.create_indexes. The planner picks it by itself,
+        so databases inserted without it still answer, only slower.
+
+        :param user_id: The ID of the user.
+        :param start: Start of the time range (inclusive).
+        :param end: End of the time range (exclusive).
+        :param modes: Only include trackpoints of activities with one of these transportation modes.
+        :param activity_ids: Only include trackpoints of these activities.
+        :param as_numpy: Return a dictionary of NumPy arrays instead of streaming dictionaries.
+        :return: A cursor of trackpoint dictionaries, or a dictionary of field -> NumPy array.
+        """
+        query = {'user_id': user_id, 'date_time': {'$gte': start, '$lt': end}}
+
+        if modes is not None:
+            # Resolve modes to the user's activities overlapping the time range
+            mode_query = {'user_id': user_id,
+                          'transportation_mode': {'$in': list(modes)},
+                          'start_date_time': {'$lt': end},
+                          'end_date_time': {'$gte': start}}
+            mode_ids = {activity['_id'] for activity in self.activity_collection.find(mode_query, {'_id': True})}
+            activity_ids = mode_ids if activity_ids is None else mode_ids & set(activity_ids)
+
+        if activity_ids is not None:
+            query['activity_id'] = {'$in': list(activity_ids)}
+
+        projection = {'_id': False, **{field: True for field in TRAJECTORY_FIELDS}}
+        cursor = self.tp_collection.find(query, projection).sort('date_time', 1)
+
+        if not as_numpy:
+            return cursor
+
+        columns = {field: [] for field in TRAJECTORY_FIELDS}
+        for trackpoint in cursor:
+            for field in TRAJECTORY_FIELDS:
+                columns[field].append(trackpoint[field])
+
+        return {'date_time': np.array(columns['date_time'], dtype='datetime64[ms]'),
+                'activity_id': np.array(columns['activity_id'], dtype=np.int64),
+                'lat': np.array(columns['lat'], dtype=np.float64),
+                'lon': np.array(columns['lon'], dtype=np.float64)}
+
+    def benchmark_trajectory_retrieval(self, user_id: str = "112", start: datetime = datetime(2008, 1, 1),
+                                       end: datetime = datetime(2009, 1, 1), mode: str = "walk", repeats: int = 5):
+        """
+        Compares the latency of the task 7 retrieval (activity ids, then one $in query) with the trajectory API.
+        Both sides select activities overlapping the time range and points within it, so they return the same points.
+
+        :param user_id: The ID of the user.
+        :param start: Start of the time range.
+        :param end: End of the time range.
+        :param mode: The transportation mode to retrieve.
+        :param repeats: Number of timed runs per approach, the average is reported.
+        """
+        print(f'Trajectory retrieval benchmark (user {user_id}, {mode}, {start} - {end}):')
+
+        def task_7_approach():
+            query = {"user_id": user_id,
+                     "transportation_mode": mode,
+                     "start_date_time": {"$lt": end},
+                     "end_date_time": {"$gte": start}}
+            activities_list = [activity['_id'] for activity in self.activity_collection.find(query)]
+            projection = {"_id": False, "activity_id": True, "lat": True, "lon": True, "date_time": True}
+            return list(self.tp_collection.find({"activity_id": {"$in": activities_list},
+                                                 "date_time": {"$gte": start, "$lt": end}}, projection))
+
+        approaches = [("Task 7 ($in on activity ids)", task_7_approach),
+                      ("Trajectory API (dicts)",
+                       lambda: list(self.trajectory(user_id, start, end, modes=[mode]))),
+                      ("Trajectory API (NumPy)",
+                       lambda: self.trajectory(user_id, start, end, modes=[mode], as_numpy=True)['date_time'])]
+
+        # Make sure the index exists before timing
+        self.connector.create_indexes()
+
+        results = []
+        for name, approach in approaches:
+            start_time = time.time()
+            for _ in range(repeats):
+                trackpoints = approach()
+            elapsed_ms = (time.time() - start_time) / repeats * 1000
+            results.append([name, len(trackpoints), elapsed_ms])
+
+        if len({trackpoints for _, trackpoints, _ in results}) > 1:
+            print("WARNING: the approaches returned different numbers of trackpoints")
+
+        df = pd.DataFrame(results, columns=["Approach", "Trackpoints", "Time (ms)"])
+        print_result(result_df=df, filename="trajectory_retrieval", floatfmt=".1f")
+
     """
     8. Find the top 20 users who have gained the most altitude meters.
         ○ Output should be a field with (id, total meters gained per user).
@@ -302,8 +726,32 @@ class Part2:
         ○ Tip: ∑ (𝑡𝑝 𝑛. 𝑎𝑙𝑡𝑖𝑡𝑢𝑑𝑒 − 𝑡𝑝 𝑛−1. 𝑎𝑙𝑡𝑖𝑡𝑢𝑑𝑒), 𝑡𝑝 𝑛. 𝑎𝑙𝑡𝑖𝑡𝑢𝑑𝑒 > 𝑡𝑝 𝑛−1. 𝑎𝑙𝑡𝑖𝑡𝑢𝑑𝑒
     """
 
-    def top_20_users_with_most_altitude_meters(self):
+    def top_20_users_with_most_altitude_meters(self, workers: int = None, approximate: bool = False,
+                                               sample_fraction: float = 0.05, time_budget: float = None):
         print_question(task_num=8, question_text="Top 20 users who have gained the most altitude meters:")
+        if approximate:
+            self.print_approximate_result('altitude', "Altitude gained (m)", "task_8_approximate",
+                                          sample_fraction, time_budget, limit=20, floatfmt=".2f")
+            return
+
+        if workers:
+            user_alt = self.partitioned_scan('altitude', workers=workers)
+        else:
+            user_alt = self._altitude_per_user()
+
+        # Sorting dictionary
+        user_alt_array = sorted(
+            user_alt.items(), key=lambda x: x[1], reverse=True)
+
+        results = []
+
+        for i, (user_id, alt) in enumerate(user_alt_array[:20]):
+            results.append([user_id, float(alt)])
+
+        df = pd.DataFrame(results, columns=["User ID", "Altitude gained (m)"])
+        print_result(result_df=df, filename="task_8", floatfmt=".2f")
+
+    def _altitude_per_user(self) -> dict:
         pipeline = {
             '_id': False,
             'user_id': True,
@@ -344,25 +792,34 @@ class Part2:
             delta_alt = alt_2 - alt_1
             user_alt[user_id] += delta_alt
 
-        # Sorting dictionary
-        user_alt_array = sorted(
-            user_alt.items(), key=lambda x: x[1], reverse=True)
-
-        results = []
-
-        for i, (user_id, alt) in enumerate(user_alt_array[:20]):
-            results.append([user_id, float(alt)])
-
-        df = pd.DataFrame(results, columns=["User ID", "Altitude gained (m)"])
-        print_result(result_df=df, filename="task_8", floatfmt=".2f")
+        return user_alt
 
     """
     9. Find all users who have invalid activities,and the number of invalid activities per user
     ○ An invalid activity is defined as an activity with consecutive trackpoints where the timestamps deviate with at least 5 minutes.
     """
 
-    def users_with_invalid_activities(self):
+    def users_with_invalid_activities(self, workers: int = None, approximate: bool = False,
+                                      sample_fraction: float = 0.05, time_budget: float = None):
         print_question(task_num=9, question_text="Users with invalid activities and the number of invalid activities:")
+        if approximate:
+            self.print_approximate_result('invalid', "Invalid activities", "task_9_approximate",
+                                          sample_fraction, time_budget)
+            return
+
+        if workers:
+            invalid_activities = sorted(self.partitioned_scan('invalid', workers=workers).items())
+        else:
+            invalid_activities = [(user_id, len(activities))
+                                  for user_id, activities in sorted(self._invalid_activities_per_user().items())]
+
+        df = pd.DataFrame(invalid_activities)
+        df.sort_values(by=1, inplace=True, ascending=False)
+        df.rename({0: "User ID", 1: "Invalid activities"}, axis=1, inplace=True)
+        print("")
+        print_result(result_df=df, filename="task_9")
+
+    def _invalid_activities_per_user(self) -> dict:
         pipeline = {
             '_id': False,
             'user_id': True,
@@ -397,19 +854,7 @@ class Part2:
             if delta_date_time.seconds > 60 * 5:
                 invalid_user_activities[user_id].add(activity_id_1)
 
-        # Sort dictionary
-        invalid_activities = sorted(invalid_user_activities.items())
-
-        results = []
-
-        for user_id, activities in invalid_activities:
-            results.append([user_id, len(activities)])
-
-        df = pd.DataFrame(results)
-        df.sort_values(by=1, inplace=True, ascending=False)
-        df.rename({0: "User ID", 1: "Invalid activities"}, axis=1, inplace=True)
-        print("")
-        print_result(result_df=df, filename="task_9")
+        return invalid_user_activities
 
     """
     10.Find the users who have tracked an activity in the Forbidden City of Beijing.
@@ -417,15 +862,22 @@ class Part2:
     coordinates that correspond to: lat 39.916, lon 116.397.
     """
 
-    def users_with_activity_in_beijing(self):
+    def users_with_activity_in_beijing(self, approximate: bool = False, sample_fraction: float = 0.05,
+                                       time_budget: float = None):
         print_question(task_num=10, question_text="Users with tracked activity in the forbidden city Beijing:")
+        if approximate:
+            # Every user with a sampled visit is certain, the estimate is their number of visiting activities
+            self.print_approximate_result('forbidden_city', "Activities in the Forbidden City", "task_10_approximate",
+                                          sample_fraction, time_budget, positive_only=True)
+            return
+
         pipeline = [{'$match': {
             'lat': {
-                '$gte': 39.916,
-                '$lte': 39.917},
+                '$gte': FORBIDDEN_CITY_LAT[0],
+                '$lte': FORBIDDEN_CITY_LAT[1]},
             'lon': {
-                '$gte': 116.397,
-                '$lte': 116.398
+                '$gte': FORBIDDEN_CITY_LON[0],
+                '$lte': FORBIDDEN_CITY_LON[1]
             }
         }
         }, {'$group': {
@@ -439,6 +891,80 @@ class Part2:
         print("")
         print_result(result_df=df, filename="task_10")
 
+    def users_near_each_other(self, distance_m: float = 100, time_s: float = 60) -> pd.DataFrame:
+        """
+        Finds pairs of users who were within distance_m meters of each other within time_s seconds.
+        Trackpoints are streamed in time order and bucketed into space-time cells (grid cell x time window),
+        so every point is only compared with points in its own and neighbouring cells of the current and
+        previous time window. Candidates are confirmed with exact haversine distance and time difference.
+
+        :param distance_m: The maximum distance in meters between the two users.
+        :param time_s: The maximum time difference in seconds between the two trackpoints.
+        :return: A dataframe of user pairs and the number of time windows they met in.
+        """
+        print(f'Users within {distance_m} meters of each other within {time_s} seconds:')
+        self.tp_collection.create_index('date_time')
+        projection = {'_id': False, 'user_id': True, 'lat': True, 'lon': True, 'date_time': True}
+        cursor = self.tp_collection.find({}, projection).sort('date_time', 1)
+
+        lat_width = distance_m / METERS_PER_DEGREE
+        lon_widths = dict()  # Latitude row -> cell width in degrees of longitude
+        distance_km = distance_m / 1000
+        # Time window -> (row, col) -> trackpoints, only the current and previous window are kept
+        windows = dict()
+        # (user_id, user_id) -> [meetings, last time window counted]
+        meetings = dict()
+
+        for trackpoint in cursor:
+            user_id, lat, lon = trackpoint['user_id'], trackpoint['lat'], trackpoint['lon']
+            seconds = (trackpoint['date_time'] - EPOCH).total_seconds()
+            window = int(seconds // time_s)
+            row = math.floor(lat / lat_width)
+
+            if window not in windows:
+                # Points are in time order, so windows older than the previous one can never match again
+                for old_window in [w for w in windows if w < window - 1]:
+                    del windows[old_window]
+                windows[window] = dict()
+
+            for neighbour_window in (window - 1, window):
+                cells = windows.get(neighbour_window)
+                if not cells:
+                    continue
+                for neighbour_row in (row - 1, row, row + 1):
+                    if neighbour_row not in lon_widths:
+                        lon_widths[neighbour_row] = colocation_lon_width(neighbour_row, lat_width)
+                    col = math.floor(lon / lon_widths[neighbour_row])
+                    for neighbour_col in (col - 1, col, col + 1):
+                        for other_user, other_lat, other_lon, other_seconds in cells.get((neighbour_row, neighbour_col), ()):
+                            if other_user == user_id:
+                                continue
+                            pair = (other_user, user_id) if other_user < user_id else (user_id, other_user)
+                            meeting = meetings.get(pair)
+                            # Each pair is counted once per time window
+                            if meeting and meeting[1] == window:
+                                continue
+                            if seconds - other_seconds > time_s:
+                                continue
+                            if haversine((lat, lon), (other_lat, other_lon)) > distance_km:
+                                continue
+                            if meeting:
+                                meeting[0] += 1
+                                meeting[1] = window
+                            else:
+                                meetings[pair] = [1, window]
+
+            if row not in lon_widths:
+                lon_widths[row] = colocation_lon_width(row, lat_width)
+            cell = (row, math.floor(lon / lon_widths[row]))
+            windows[window].setdefault(cell, []).append((user_id, lat, lon, seconds))
+
+        results = [[user_1, user_2, count] for (user_1, user_2), (count, _) in meetings.items()]
+        df = pd.DataFrame(results, columns=["User ID", "Other user ID", "Meetings"])
+        df.sort_values(by=["Meetings", "User ID", "Other user ID"], ascending=[False, True, True], inplace=True)
+        print_result(result_df=df, filename="colocation")
+        return df
+
     """
     11.Find all users who have registered transportation_mode and their most used transportation_mode.
     ○ The answer should be on format (user_id, most_used_transportation_mode) sorted on user_id.
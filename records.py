@@ -0,0 +1,87 @@
+import pandas as pd
+
+
+class UserRecord:
+    """
+    A user of the dataset.
+    Only _id and has_labels are persisted, path and labels are filesystem metadata used during ingest.
+    """
+    __slots__ = ('_id', 'has_labels', 'path', 'labels')
+
+    def __init__(self, _id: str, has_labels: bool, path: str):
+        self._id = _id
+        self.has_labels = has_labels
+        self.path = path
+        self.labels = None  # Transportation labels, read once on first use
+
+    def to_document(self) -> dict:
+        """
+        :return: The persisted fields as a document for the user collection.
+        """
+        return {'_id': self._id, 'has_labels': self.has_labels}
+
+
+class ActivityRecord:
+    """
+    An activity, i.e. one trajectory file of a user.
+    Only path is filesystem metadata, every other field is persisted.
+    """
+    __slots__ = ('_id', 'user_id', 'transportation_mode', 'start_date_time', 'end_date_time', 'path')
+
+    def __init__(self, _id: int, user_id: str, path: str):
+        self._id = _id
+        self.user_id = user_id
+        self.transportation_mode = None
+        self.start_date_time = None
+        self.end_date_time = None
+        self.path = path
+
+    def to_document(self) -> dict:
+        """
+        :return: The persisted fields as a document for the activity collection.
+        """
+        return {'_id': self._id,
+                'user_id': self.user_id,
+                'transportation_mode': self.transportation_mode,
+                'start_date_time': self.start_date_time,
+                'end_date_time': self.end_date_time}
+
+
+class TrackpointBatch:
+    """
+    The trackpoints of one activity, stored column-wise instead of as one dictionary per trackpoint.
+    """
+    __slots__ = ('activity_id', 'user_id', 'lat', 'lon', 'altitude', 'date_days', 'date_time')
+
+    def __init__(self, activity_id: int, user_id: str, trackpoints_df: pd.DataFrame):
+        """
+        :param activity_id: The ID of the activity.
+        :param user_id: The ID of the user.
+        :param trackpoints_df: A data frame of the activity's .plt file.
+        """
+        self.activity_id = activity_id
+        self.user_id = user_id
+        self.lat = trackpoints_df['lat'].tolist()
+        self.lon = trackpoints_df['lon'].tolist()
+        # -777 marks an invalid altitude
+        self.altitude = [alt if alt != -777 else None for alt in trackpoints_df['alt'].tolist()]
+        self.date_days = trackpoints_df['date'].tolist()
+        self.date_time = pd.to_datetime(trackpoints_df['date_str'] + " " + trackpoints_df['time_str'],
+                                        format='%Y-%m-%d %H:%M:%S').tolist()  # Timestamps are datetimes
+
+    def __len__(self):
+        return len(self.lat)
+
+    def to_documents(self):
+        """
+        :return: A generator of documents for the trackpoint collection, one per trackpoint.
+        """
+        for lat, lon, altitude, date_days, date_time in zip(self.lat, self.lon, self.altitude,
+                                                             self.date_days, self.date_time):
+            yield {'activity_id': self.activity_id,
+                   'lat': lat,
+                   'lon': lon,
+                   'altitude': altitude,
+                   'date_days': date_days,
+                   'date_time': date_time,
+                   'user_id': self.user_id}